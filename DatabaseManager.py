@@ -1,18 +1,27 @@
-import psycopg
-from psycopg.rows import dict_row
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool
 import logging
 from config import DB_CONFIG
 
+# Seconds to wait for a pooled connection before giving up
+POOL_TIMEOUT_SECONDS = 5
+
 class DatabaseManager:
+    # Shared pool so repeated syncs in one process reuse physical connections
+    pool = None
+
     def __init__(self):
         self.connection = None
         self.cursor = None
 
     def connect(self):
-        """Connect to PostgreSQL database"""
+        """Check out a PostgreSQL connection from the pool"""
         try:
-            self.connection = psycopg.connect(**DB_CONFIG)
-            self.cursor = self.connection.cursor(row_factory=dict_row)
+            if DatabaseManager.pool is None:
+                DatabaseManager.pool = ConnectionPool(kwargs=DB_CONFIG, min_size=1, max_size=5,
+                                                      num_workers=1, open=True)
+            self.connection = DatabaseManager.pool.getconn(timeout=POOL_TIMEOUT_SECONDS)
+            self.cursor = self.connection.cursor()
             logging.info("Database connection established")
             return True
         except Exception as e:
@@ -37,21 +46,55 @@ class DatabaseManager:
         );
         """
 
-        create_gps_points_table = """
-        CREATE TABLE IF NOT EXISTS gps_points (
-            id SERIAL PRIMARY KEY,
-            run_id INTEGER REFERENCES runs(id),
-            timestamp TIMESTAMP,
-            latitude DECIMAL(10, 8),
-            longitude DECIMAL(11, 8),
-            elevation_meters FLOAT,
-            speed_mps FLOAT
+        # Each run's GPS track is stored as parallel arrays on the run row
+        add_track_columns = """
+        ALTER TABLE runs
+            ADD COLUMN IF NOT EXISTS track_timestamps TIMESTAMPTZ[],
+            ADD COLUMN IF NOT EXISTS track_latitudes REAL[],
+            ADD COLUMN IF NOT EXISTS track_longitudes REAL[],
+            ADD COLUMN IF NOT EXISTS track_elevations REAL[];
+        """
+
+        # One-off move of tracks from the old one-row-per-point gps_points table
+        # into the run arrays; the table is renamed afterwards so this only runs once
+        migrate_gps_points = """
+        DO $$
+        BEGIN
+            IF to_regclass('gps_points') IS NOT NULL THEN
+                UPDATE runs
+                SET track_timestamps = points.timestamps,
+                    track_latitudes = points.latitudes,
+                    track_longitudes = points.longitudes,
+                    track_elevations = points.elevations
+                FROM (
+                    SELECT run_id,
+                           array_agg(timestamp::timestamptz ORDER BY timestamp, id) AS timestamps,
+                           array_agg(latitude::real ORDER BY timestamp, id) AS latitudes,
+                           array_agg(longitude::real ORDER BY timestamp, id) AS longitudes,
+                           array_agg(elevation_meters::real ORDER BY timestamp, id) AS elevations
+                    FROM gps_points
+                    GROUP BY run_id
+                ) AS points
+                WHERE runs.id = points.run_id AND runs.track_timestamps IS NULL;
+
+                ALTER TABLE gps_points RENAME TO gps_points_migrated;
+            END IF;
+        END $$;
+        """
+
+        # Newest Garmin activity already synced, so unchanged runs can be skipped
+        create_sync_state_table = """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            last_activity_id BIGINT
         );
         """
 
         try:
             self.cursor.execute(create_runs_table)
-            self.cursor.execute(create_gps_points_table)
+            self.cursor.execute(add_track_columns)
+            self.cursor.execute(migrate_gps_points)
+            self.cursor.execute(create_sync_state_table)
             self.connection.commit()
             logging.info("Database tables created/verified")
         except Exception as e:
@@ -59,7 +102,7 @@ class DatabaseManager:
             self.connection.rollback()
 
     def insert_run(self, run_data):
-        """Insert a new run record"""
+        """Insert a new run record, returning None if it already exists"""
         insert_query = """
         INSERT INTO runs (activity_id, start_time, end_time, distance_meters,
                          duration_seconds, avg_pace_seconds_per_km, calories,
@@ -67,13 +110,21 @@ class DatabaseManager:
         VALUES (%(activity_id)s, %(start_time)s, %(end_time)s, %(distance_meters)s,
                 %(duration_seconds)s, %(avg_pace_seconds_per_km)s, %(calories)s,
                 %(avg_heart_rate)s, %(max_heart_rate)s)
+        ON CONFLICT (activity_id) DO NOTHING
         RETURNING id;
         """
 
         try:
-            self.cursor.execute(insert_query, run_data)
-            run_id = self.cursor.fetchone()['id']
-            self.connection.commit()
+            # Pipeline the INSERT and COMMIT so both go out in one round-trip
+            with self.connection.pipeline():
+                self.cursor.execute(insert_query, run_data)
+                self.connection.commit()
+                result = self.cursor.fetchone()
+            if result is None:
+                # Only reached if another sync stored it after main()'s existence check
+                logging.info(f"Activity {run_data['activity_id']} was stored by a concurrent sync")
+                return None
+            run_id = result[0]
             logging.info(f"Run inserted with ID: {run_id}")
             return run_id
         except Exception as e:
@@ -81,41 +132,84 @@ class DatabaseManager:
             self.connection.rollback()
             return None
 
-    def insert_gps_points(self, run_id, gps_points):
-        """Insert GPS points for a run"""
-        insert_query = """
-        INSERT INTO gps_points (run_id, timestamp, latitude, longitude,
-                               elevation_meters, speed_mps)
-        VALUES (%(run_id)s, %(timestamp)s, %(latitude)s, %(longitude)s,
-                %(elevation_meters)s, %(speed_mps)s);
+    def store_gps_track(self, run_id, gps_track):
+        """Store the GPS track for a run as arrays on its runs row"""
+        update_query = """
+        UPDATE runs
+        SET track_timestamps = %s, track_latitudes = %s,
+            track_longitudes = %s, track_elevations = %s
+        WHERE id = %s;
         """
 
         try:
-            for point in gps_points:
-                point['run_id'] = run_id
-                self.cursor.execute(insert_query, point)
-            self.connection.commit()
-            logging.info(f"Inserted {len(gps_points)} GPS points for run {run_id}")
+            with self.connection.pipeline():
+                self.cursor.execute(update_query, (*gps_track.columns(), run_id))
+                self.connection.commit()
+            logging.info(f"Stored GPS track with {len(gps_track)} points for run {run_id}")
         except Exception as e:
-            logging.error(f"Error inserting GPS points: {e}")
+            logging.error(f"Error storing GPS track: {e}")
             self.connection.rollback()
 
     def get_activity_by_id(self, activity_id):
-        """Check if an activity already exists in the database"""
+        """Return the run id for an activity, or None if it isn't in the database"""
         query = "SELECT id FROM runs WHERE activity_id = %s"
 
         try:
             self.cursor.execute(query, (activity_id,))
             result = self.cursor.fetchone()
-            return result
+            return result[0] if result else None
         except Exception as e:
             logging.error(f"Error checking for existing activity: {e}")
             return None
 
+    def get_last_activity_id(self):
+        """Return the newest Garmin activity ID already synced, or None"""
+        query = "SELECT last_activity_id FROM sync_state"
+
+        try:
+            self.cursor.execute(query)
+            result = self.cursor.fetchone()
+            self.connection.commit()
+            return result[0] if result else None
+        except Exception as e:
+            logging.error(f"Error reading sync state: {e}")
+            self.connection.rollback()
+            return None
+
+    def update_last_activity_id(self, activity_id):
+        """Record activity_id as synced, never moving the cursor backwards"""
+        upsert_query = """
+        INSERT INTO sync_state (last_activity_id) VALUES (%s)
+        ON CONFLICT (id) DO UPDATE
+        SET last_activity_id = GREATEST(sync_state.last_activity_id, EXCLUDED.last_activity_id);
+        """
+
+        try:
+            with self.connection.pipeline():
+                self.cursor.execute(upsert_query, (activity_id,))
+                self.connection.commit()
+            logging.info(f"Sync state updated to activity {activity_id}")
+        except Exception as e:
+            logging.error(f"Error updating sync state: {e}")
+            self.connection.rollback()
+
     def close(self):
-        """Close database connection"""
+        """Return database connection to the pool"""
         if self.cursor:
             self.cursor.close()
         if self.connection:
-            self.connection.close()
-        logging.info("Database connection closed")
+            # End any open transaction so the pool gets a clean connection back;
+            # broken connections go straight to putconn, which discards them
+            if self.connection.info.transaction_status in (TransactionStatus.INTRANS,
+                                                           TransactionStatus.INERROR):
+                self.connection.rollback()
+            DatabaseManager.pool.putconn(self.connection)
+            self.connection = None
+        logging.info("Database connection returned to pool")
+
+    @classmethod
+    def close_pool(cls):
+        """Close the shared connection pool"""
+        if cls.pool is not None:
+            cls.pool.close()
+            cls.pool = None
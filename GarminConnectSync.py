@@ -1,19 +1,62 @@
-from garminconnect import Garmin
+import io
 import logging
-from datetime import datetime, timedelta
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import ciso8601
+
+# Fully qualified GPX 1.1 tags, as reported by ElementTree
+GPX_NS = 'http://www.topografix.com/GPX/1/1'
+TRKSEG_TAG = f'{{{GPX_NS}}}trkseg'
+TRKPT_TAG = f'{{{GPX_NS}}}trkpt'
+ELE_TAG = f'{{{GPX_NS}}}ele'
+TIME_TAG = f'{{{GPX_NS}}}time'
+
+# Number of activities requested from Garmin per page
+ACTIVITY_PAGE_SIZE = 20
+
+class GpsTrack:
+    """GPS track stored as one float32 column per field rather than a dict per point"""
+    def __init__(self):
+        self.timestamps = []
+        self.latitudes = array('f')
+        self.longitudes = array('f')
+        self.elevations = array('f')  # NaN where the point has no elevation
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, latitude, longitude, elevation=None):
+        """Add a single trackpoint to the track"""
+        self.timestamps.append(timestamp)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.elevations.append(math.nan if elevation is None else elevation)
+
+    def columns(self):
+        """Return (timestamps, latitudes, longitudes, elevations) as plain lists"""
+        elevations = [None if math.isnan(ele) else ele for ele in self.elevations]
+        return self.timestamps, self.latitudes.tolist(), self.longitudes.tolist(), elevations
 
 class GarminConnectSync:
-    def __init__(self, email, password):
+    def __init__(self, email, password, tokenstore=None):
         self.email = email
         self.password = password
+        self.tokenstore = tokenstore
         self.client = None
         self.logged_in = False
 
     def login(self):
-        """Login to Garmin Connect"""
+        """Login to Garmin Connect, reusing cached tokens when available"""
+        # Imported here so code that only parses GPX doesn't pay for loading garminconnect
+        from garminconnect import Garmin
+
         try:
             self.client = Garmin(self.email, self.password)
-            self.client.login()
+            # Falls back to email/password if the stored tokens are missing or
+            # expired, then saves the fresh tokens for the next run
+            self.client.login(tokenstore=self.tokenstore)
             self.logged_in = True
             logging.info("Successfully logged into Garmin Connect")
             return True
@@ -22,32 +65,25 @@ class GarminConnectSync:
             self.logged_in = False
             return False
 
-    def get_latest_run(self):
-        """Get the most recent running activity"""
+    def get_latest_run(self, last_activity_id=None):
+        """Get the most recent running activity, or None if it isn't newer than last_activity_id"""
         if not self.logged_in:
             logging.error("Not logged into Garmin Connect")
             return None
 
         try:
-            # Get activities from last 30 days
-            activities = self.client.get_activities(0, 100)
-            logging.info(f"Found {len(activities)} total activities")
-
-            # Filter for running activities
-            running_activities = []
-            for activity in activities:
-                activity_type = activity.get('activityType', {})
-                if activity_type and activity_type.get('typeKey') == 'running':
-                    running_activities.append(activity)
-
-            logging.info(f"Found {len(running_activities)} running activities")
+            # Only the newest run is needed, filtered by Garmin (sorted newest first)
+            running_activities = self.client.get_activities(0, 1, activitytype='running')
 
             if not running_activities:
                 logging.info("No running activities found")
                 return None
 
-            # Get the most recent one
             latest_run = running_activities[0]
+            if last_activity_id is not None and latest_run['activityId'] <= last_activity_id:
+                logging.info(f"Latest run {latest_run['activityId']} has already been synced")
+                return None
+
             activity_id = latest_run['activityId']
 
             logging.info(f"Getting detailed data for activity {activity_id}")
@@ -89,10 +125,6 @@ class GarminConnectSync:
                 'max_heart_rate': summary_activity.get('maxHR'),
             }
 
-            # Try to get GPS points if available
-            gps_points = self.get_gps_data(summary_activity.get('activityId'))
-            formatted_data['gps_points'] = gps_points
-
             logging.info(f"Formatted activity data for run: {round(formatted_data['distance_meters'] / 1000, 2)} km in {round(formatted_data['duration_seconds'] / 60, 2)} mins")
 
             return formatted_data
@@ -114,55 +146,71 @@ class GarminConnectSync:
         try:
             # Get GPX data
             gpx_data = self.client.download_activity(activity_id, dl_fmt=self.client.ActivityDownloadFormat.GPX)
-            gps_points = self.parse_gpx_simple(gpx_data)
+            gps_track = self.parse_gpx_simple(gpx_data)
 
-            logging.info(f"Retrieved {len(gps_points)} GPS points")
-            return gps_points
+            logging.info(f"Retrieved {len(gps_track)} GPS points")
+            return gps_track
 
         except Exception as e:
             logging.warning(f"Could not retrieve GPS data: {e}")
-            return []
+            return GpsTrack()
 
     def parse_gpx_simple(self, gpx_data):
-        """Simple GPX parser to extract GPS points"""
+        """Simple GPX parser to extract GPS points into a GpsTrack"""
         import xml.etree.ElementTree as ET
 
-        gps_points = []
+        gps_track = GpsTrack()
+        trkseg = None
         try:
-            root = ET.fromstring(gpx_data)
-
-            # Find all trackpoints
-            for trkpt in root.iter():
-                if 'trkpt' in trkpt.tag:
+            # Stream the document so each trackpoint can be freed once read
+            for event, trkpt in ET.iterparse(io.BytesIO(gpx_data), events=('start', 'end')):
+                if event == 'start':
+                    if trkpt.tag == TRKSEG_TAG:
+                        trkseg = trkpt
+                    continue
+
+                if trkpt.tag == TRKPT_TAG:
                     lat = trkpt.get('lat')
                     lon = trkpt.get('lon')
 
                     if lat and lon:
-                        point = {
-                            'latitude': float(lat),
-                            'longitude': float(lon),
-                            'elevation_meters': None,
-                            'speed_mps': None,
-                            'timestamp': datetime.now()  # You'd parse actual timestamp from GPX
-                        }
+                        elevation = None
+                        timestamp = None
 
                         # Try to get elevation
                         for child in trkpt:
-                            if 'ele' in child.tag:
-                                point['elevation_meters'] = float(child.text) if child.text else None
-                            elif 'time' in child.tag and child.text:
-                                # Parse timestamp
+                            if child.tag == ELE_TAG:
+                                elevation = float(child.text) if child.text else None
+                            elif child.tag == TIME_TAG and child.text:
+                                # Parse timestamp, GPX times without an offset are UTC
                                 try:
-                                    point['timestamp'] = datetime.fromisoformat(child.text.replace('Z', '+00:00'))
+                                    timestamp = ciso8601.parse_datetime(child.text)
+                                    if timestamp.tzinfo is None:
+                                        timestamp = timestamp.replace(tzinfo=timezone.utc)
                                 except:
                                     pass
 
-                        gps_points.append(point)
+                        # A missing or unparseable time is stored as NULL
+                        gps_track.append(timestamp, float(lat), float(lon), elevation)
+
+                    # Detach the trackpoint so the segment doesn't keep it alive
+                    if trkseg is not None:
+                        trkseg.remove(trkpt)
 
         except Exception as e:
             logging.warning(f"Error parsing GPX data: {e}")
 
-        return gps_points
+        return gps_track
+
+    def iter_activities(self, page_size=ACTIVITY_PAGE_SIZE):
+        """Yield activities newest first, fetching one page at a time as needed"""
+        start = 0
+        while True:
+            page = self.client.get_activities(start, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            start += page_size
 
     def get_activities_since(self, days_back=7):
         """Get all activities from the last N days"""
@@ -171,9 +219,9 @@ class GarminConnectSync:
             return []
 
         try:
-            activities = self.client.get_activities(0, days_back * 10)  # Estimate activities per day
+            activities = self.iter_activities()
 
-            # Filter by date
+            # Filter by date, activities come back newest first so stop at the first old one
             cutoff_date = datetime.now() - timedelta(days=days_back)
             recent_activities = []
 
@@ -181,8 +229,9 @@ class GarminConnectSync:
                 start_time_str = activity.get('startTimeLocal', '')
                 if start_time_str:
                     start_time = datetime.fromisoformat(start_time_str.replace('Z', ''))
-                    if start_time > cutoff_date:
-                        recent_activities.append(activity)
+                    if start_time <= cutoff_date:
+                        break
+                    recent_activities.append(activity)
 
             return recent_activities
 
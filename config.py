@@ -15,6 +15,7 @@ DB_CONFIG = {
 # Garmin Connect configuration
 GARMIN_EMAIL = os.getenv('GARMIN_EMAIL')
 GARMIN_PASSWORD = os.getenv('GARMIN_PASSWORD')
+GARMIN_TOKENSTORE = os.getenv('GARMINTOKENS', '~/.garminconnect')
 
 # Garmin device configuration
 GARMIN_DEVICE_NAME = "Forerunner 255 Music"
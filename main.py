@@ -1,8 +1,9 @@
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from DatabaseManager import DatabaseManager
 from GarminConnectSync import GarminConnectSync
-from config import DB_CONFIG, GARMIN_EMAIL, GARMIN_PASSWORD
+from config import DB_CONFIG, GARMIN_EMAIL, GARMIN_PASSWORD, GARMIN_TOKENSTORE
 
 # Configure logging
 logging.basicConfig(
@@ -32,7 +33,7 @@ def main():
     db.create_tables()
 
     # Initialize Garmin Connect client
-    garmin = GarminConnectSync(GARMIN_EMAIL, GARMIN_PASSWORD)
+    garmin = GarminConnectSync(GARMIN_EMAIL, GARMIN_PASSWORD, GARMIN_TOKENSTORE)
 
     try:
         # Login to Garmin Connect
@@ -40,25 +41,36 @@ def main():
             logging.error("Failed to login to Garmin Connect")
             return
 
-        # Get the latest running activity
-        activity_data = garmin.get_latest_run()
+        # Get the latest running activity, unless it was already synced
+        activity_data = garmin.get_latest_run(db.get_last_activity_id())
         if not activity_data:
             logging.info("No new running activities found")
             return
 
-        # Check if this activity is already in the database
-        existing_activity = db.get_activity_by_id(activity_data['activity_id'])
-        if existing_activity:
+        activity_id = int(activity_data['activity_id'])
+
+        # Check if this activity is already in the database before downloading its GPX
+        if db.get_activity_by_id(activity_data['activity_id']):
             logging.info(f"Activity with ID = {activity_data['activity_id']} already exists in database")
+            # Stored by an earlier sync, so move the cursor past it
+            db.update_last_activity_id(activity_id)
             return
 
-        # Store run data
-        gps_points = activity_data.pop('gps_points', [])
-        run_id = db.insert_run(activity_data)
+        # Download the GPS track in the background while the run is stored
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            gps_future = executor.submit(garmin.get_gps_data, activity_data['activity_id'])
+
+            # Store run data, still skipped if a concurrent sync stored it first
+            run_id = db.insert_run(activity_data)
+            gps_track = gps_future.result()
+
+        if not run_id:
+            return
 
-        if run_id and gps_points:
-            db.insert_gps_points(run_id, gps_points)
-            logging.info(f"Stored {len(gps_points)} GPS points")
+        if gps_track:
+            db.store_gps_track(run_id, gps_track)
+
+        db.update_last_activity_id(activity_id)
 
         logging.info("Sync completed successfully")
 
@@ -70,4 +82,8 @@ def main():
         db.close()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # The pool outlives individual syncs, so only close it at process exit
+        DatabaseManager.close_pool()